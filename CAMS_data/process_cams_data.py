@@ -6,15 +6,45 @@
 
 #Import required libraries
 import pvlib
+import numpy as np
 import pandas as pd
 import datetime
-import json
+import orjson
 import os
+import io
+import pathlib
+import asyncio
+import functools
+import argparse
+import aiohttp
+import yarl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pvlib.iotools.sodapro import TIME_STEPS_MAP
+
+
+#Default SoDa Pro CAMS Radiation API server, as used by pvlib.iotools.get_cams
+CAMS_SERVER = 'api.soda-solardata.com'
+
+#Columns identifying a farm and date range already fetched, recorded in the results manifest
+MANIFEST_COLUMNS = ['Latitude', 'Longitude', 'start_date', 'end_date', 'identifier', 'time_step']
+
+#Number of runs a farm whose request fails is attempted before it is given up
+MAX_FETCH_ATTEMPTS = 3
 
 
 # In[84]:
 
 
+@functools.lru_cache(maxsize=8)
+def _read_config(file_path, mtime):
+    """
+    Parses a JSON configuration file, memoized on the file path and its modification time.
+    """
+    with open(file_path, "rb") as json_file:
+        return orjson.loads(json_file.read())
+
+
 def load_config(file_path):
     """
     Loads a configuration file in JSON format.
@@ -23,10 +53,11 @@ def load_config(file_path):
     Returns:
         dict: The parsed configuration data as a Python dictionary if successful.
         None: If an error occurs during file reading or JSON parsing.
+    Note:
+        The parsed result is cached until the file is modified, callers should not mutate it.
     """
     try:
-        with open(file_path, "r") as json_file:
-            config = json.load(json_file)
+        config = _read_config(file_path, os.path.getmtime(file_path))
         return config
     except Exception as e:
         print(f"Error occured: {e}")
@@ -37,7 +68,7 @@ def load_config(file_path):
 
 def get_file_to_process(data_folder):
     """
-    Retrieves the oldest file from a specified folder.
+    Retrieves the oldest Parquet file from a specified folder.
     Parameters:
         data_folder (str): The path to the folder containing the files.
     Returns:
@@ -45,31 +76,164 @@ def get_file_to_process(data_folder):
         None: If no files are present in the folder or an error occurs.
     """
     try:
-        files = [os.path.join(data_folder, f) for f in os.listdir(data_folder) if os.path.isfile(os.path.join(data_folder, f))]
-        files.sort(key=os.path.getctime)
+        #DirEntry objects cache their stat results, so each file is only stat'ed once
+        with os.scandir(data_folder) as entries:
+            files = [entry for entry in entries if entry.name.endswith('.parquet') and entry.is_file()]
 
         if files:
-            return files[0]
+            return min(files, key=lambda entry: entry.stat().st_ctime).path
         else:
             print("There is no datafile to process.")
             return None
-    except:
+    except OSError as e:
         print(f"An error occured {e}")
-        return None       
+        return None
    
 
 
 # In[86]:
 
 
-def fetch_cams_data(solar_data, start_date, end_date, email, identifier='mcclear', altitude=None, time_step='1h',
-                    time_ref='UT', verbose=False, integrated=False, label=None, map_variables=True, 
-                    server=None, timeout=None):
+def build_cams_url(latitude, longitude, start_date, end_date, email, identifier='mcclear', altitude=None,
+                   time_step='1h', time_ref='UT', verbose=False, server=None):
+    """
+    Builds the SoDa WPS request URL for a single location, following pvlib.iotools.get_cams.
+    Parameters:
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+        start_date (str): Start date in the format "YYYY-MM-DD".
+        end_date (str): End date in the format "YYYY-MM-DD".
+        email (str): Email for accessing the CAMS service.
+        identifier (str): CAMS identifier ('mcclear' or 'cams_radiation').
+        altitude (float): Altitude of the location (optional).
+        time_step (str): Time step for the data ('1min', '15min', '1h', '1d', '1M').
+        time_ref (str): ‘UT’ (universal time) or ‘TST’ (True Solar Time).
+        verbose (bool): Whether to request verbose output (only supported for 1min UT time series).
+        server (str): Base url of the SoDa Pro CAMS Radiation API.
+    Returns:
+        yarl.URL: The already encoded request URL.
+    """
+    if time_step not in TIME_STEPS_MAP:
+        raise ValueError(f"Time step not recognized. Must be one of {list(TIME_STEPS_MAP.keys())}")
+    if identifier not in ['mcclear', 'cams_radiation']:
+        raise ValueError("Identifier must be either mcclear or cams_radiation")
+    if verbose and (time_step != '1min' or time_ref != 'UT'):
+        print("Verbose mode only supports 1 min. UT time series!")
+        verbose = False
+
+    data_inputs = {
+        #str() gives the shortest repr of float32 coordinates, f-string formatting would widen them to float64
+        'latitude': str(latitude),
+        'longitude': str(longitude),
+        #-999 lets SoDa get the elevation from the NASA SRTM database
+        'altitude': -999 if altitude is None else altitude,
+        'date_begin': pd.to_datetime(start_date).strftime('%Y-%m-%d'),
+        'date_end': pd.to_datetime(end_date).strftime('%Y-%m-%d'),
+        'time_ref': time_ref,
+        'summarization': TIME_STEPS_MAP[time_step],
+        'username': email.replace('@', '%2540'),
+        'verbose': str(verbose).lower(),
+    }
+
+    #DataInputs are separated by semicolons and must be passed to the server without further encoding
+    data_inputs = ";".join(f"{key}={value}" for key, value in data_inputs.items())
+    query = (f"DataInputs={data_inputs}&Service=WPS&Request=Execute&Identifier=get_{identifier.lower()}"
+             f"&version=1.0.0&RawDataOutput=irradiation")
+    return yarl.URL(f"https://{server or CAMS_SERVER}/service/wps?{query}", encoded=True)
+
+
+# In[ ]:
+
+
+async def fetch_cams_location(session, semaphore, url, integrated=False, label=None, map_variables=True,
+                              retries=3, backoff=2):
+    """
+    Fetches and parses CAMS data for a single location, retrying on connection errors, timeouts,
+    rate limiting (HTTP 429) and server errors (HTTP 5xx).
+    Parameters:
+        session (aiohttp.ClientSession): Session shared by all requests, so connections are reused.
+        semaphore (asyncio.Semaphore): Limits the number of requests in flight.
+        url (yarl.URL): Request URL built by build_cams_url.
+        integrated (bool): Whether to return radiation parameters as integrated values (Wh/m^2).
+        label (str): Label for the time index ('left' or 'right').
+        map_variables (bool): When true, renames columns of the DataFrame to pvlib variable names where applicable.
+        retries (int): Maximum number of attempts before the error is raised.
+        backoff (int): Base of the exponential wait (in seconds) between attempts.
+    Returns:
+        tuple: The (data, metadata) tuple returned by pvlib.iotools.parse_cams.
+    """
+    for attempt in range(retries):
+        try:
+            async with semaphore:
+                async with session.get(url) as response:
+                    text = await response.text(encoding='utf-8')
+            if response.status != 429 and response.status < 500:
+                break
+            error = f"HTTP {response.status} {response.reason}"
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == retries - 1:
+                raise
+            error = repr(e)
+
+        if attempt < retries - 1:
+            wait = backoff ** attempt
+            print(f"Transient error for {url}: {error}. Retrying in {wait}s.")
+            await asyncio.sleep(wait)
+
+    #Failed requests return an HTTP error status (400 for invalid requests) with the reason in an XML body
+    if not response.ok:
+        errors = text.split('ows:ExceptionText')
+        reason = errors[1][1:-2] if len(errors) > 1 else response.reason
+        raise RuntimeError(f"CAMS request failed with HTTP {response.status}: {reason}")
+
+    return pvlib.iotools.parse_cams(io.StringIO(text), integrated=integrated, label=label,
+                                    map_variables=map_variables)
+
+
+# In[ ]:
+
+
+async def fetch_all_locations(urls, on_response, timeout=None, max_workers=8, **parse_kwargs):
+    """
+    Fetches CAMS data for several locations concurrently over a single HTTP session.
+    Parameters:
+        urls (list): Request URLs built by build_cams_url.
+        on_response (callable): Called with the index of the URL and its (data, metadata) tuple or raised
+                                exception as soon as each response arrives, so responses are not kept in memory.
+        timeout (int): Time in seconds to wait for the connection and for each read from the server before timeout,
+                       as in requests, large responses may take longer than this in total.
+        max_workers (int): Maximum number of concurrent requests sent to the CAMS service.
+        parse_kwargs: Keyword arguments passed on to fetch_cams_location.
+    Returns:
+        None
+    """
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def fetch_and_handle(session, index, url):
+        try:
+            response = await fetch_cams_location(session, semaphore, url, **parse_kwargs)
+        except Exception as e:
+            response = e
+        on_response(index, response)
+
+    #Like the requests timeout used by pvlib, only connecting and each socket read are limited
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    async with aiohttp.ClientSession(timeout=client_timeout) as session:
+        await asyncio.gather(*(fetch_and_handle(session, index, url) for index, url in enumerate(urls)))
+
+
+# In[ ]:
+
+
+def fetch_cams_data(solar_data, output_file, start_date, end_date, email, identifier='mcclear', altitude=None,
+                    time_step='1h', time_ref='UT', verbose=False, integrated=False, label=None, map_variables=True,
+                    server=None, timeout=None, max_workers=8, grid_resolution=None):
     """
-    Fetch CAMS data for each record in a DataFrame and combine into a master DataFrame.
+    Fetch CAMS data for each record in a DataFrame and stream it into a single Parquet file.
     
     Parameters:
         solar_data (pd.DataFrame): Input DataFrame containing 'latitude' and 'longitude' columns.
+        output_file (str or Path): Path of the Parquet file the CAMS data is written to as responses arrive.
         start (str): Start date-time in ISO8601 format (e.g., '2023-01-01T00:00:00').
         end (str): End date-time in ISO8601 format (e.g., '2023-01-01T23:59:59').
         email (str): Email for accessing the CAMS service.
@@ -86,94 +250,205 @@ def fetch_cams_data(solar_data, start_date, end_date, email, identifier='mcclear
         map_variables (bool): When true, renames columns of the DataFrame to pvlib variable names where applicable.
         server (str): Base url of the SoDa Pro CAMS Radiation API.
         timeout (int): Time in seconds to wait for server response before timeout
+        max_workers (int): Maximum number of concurrent requests sent to the CAMS service.
+        grid_resolution (float): Size in degrees of the grid the coordinates are snapped to (e.g. 0.05) before
+                                 requesting data, so farms in the same cell share one request. None requests
+                                 the exact coordinates of every farm.
         References: https://pvlib-python.readthedocs.io/en/stable/reference/generated/pvlib.iotools.get_cams.html#id9
     Returns:
-        pd.DataFrame: Master DataFrame containing CAMS data for all records.
+        tuple: The number of rows and the number of unique farm (Latitude, Longitude) pairs written to
+               output_file, the file is not created if no data was returned.
     """
-    cams_df = pd.DataFrame()  
-
-    for idx, row in solar_data.iterrows():
-        try:
-            print(row['Latitude'], row['Longitude'], start_date, end_date, email, identifier, altitude, time_step, time_ref, verbose, integrated, label, map_variables, server, timeout)
-            # Fetch CAMS data for the current record
-            data, metadata = pvlib.iotools.get_cams(
-                row['Latitude'], row['Longitude'], start_date, end_date, email,
-                identifier, altitude, time_step, time_ref,
-                verbose, integrated, label, map_variables,
-                server, timeout
-            )
-            
-            # Add latitude and longitude to the returned data
-            data.insert(0, 'Latitude', row['Latitude'])
-            data.insert(1, 'Longitude', row['Longitude'])
-
-            # Append the current data to the master DataFrame
-            cams_df = pd.concat([cams_df, data], ignore_index=True)
+    #Only the coordinates are used, plain float32 arrays avoid pandas indexing in the loops below
+    farm_lats = solar_data['Latitude'].to_numpy(dtype=np.float32, copy=False)
+    farm_lons = solar_data['Longitude'].to_numpy(dtype=np.float32, copy=False)
+    if grid_resolution:
+        # CAMS irradiance is smooth within a grid cell, farms in the same cell share a request at its centre
+        #Snapping in float64 keeps the centres on the grid, e.g. 46.35 rather than 46.350002 in float32
+        request_lats = (np.round(farm_lats.astype(np.float64) / grid_resolution) * grid_resolution).astype(np.float32)
+        request_lons = (np.round(farm_lons.astype(np.float64) / grid_resolution) * grid_resolution).astype(np.float32)
+    else:
+        request_lats, request_lons = farm_lats, farm_lons
+
+    # Request each unique location once, the response is written once for every farm coordinate pair it covers,
+    # farms sharing coordinates cannot be told apart in the output, so they get a single copy
+    farms_by_location = {}
+    for location, farm in zip(zip(request_lats, request_lons), zip(farm_lats, farm_lons)):
+        farms_by_location.setdefault(location, {})[farm] = None
+    unique_locations = list(farms_by_location)
+    urls = [build_cams_url(lat, lon, start_date, end_date, email, identifier, altitude, time_step, time_ref,
+                           verbose, server) for lat, lon in unique_locations]
+
+    writer = None
+    rows_written = 0
+    farms_written = 0
+
+    def write_response(index, response):
+        # Runs on the event loop thread, so writes never overlap
+        nonlocal writer, rows_written, farms_written
+        lat, lon = unique_locations[index]
+        if isinstance(response, Exception):
+            print(f"Error processing location with latitude {lat} and longitude {lon}: {response!r}")
+            return
+        data, metadata = response
+
+        # The response is converted once, the CAMS timestamp index is kept as a column of the table
+        table = pa.Table.from_pandas(data, preserve_index=True)
+
+        # Repeat the rows for every farm covered by the response, concatenating the same table does not copy it
+        farms = np.array(list(farms_by_location[(lat, lon)]), dtype=np.float32)
+        farms_table = pa.concat_tables([table] * len(farms))
+
+        # Add the farm latitude and longitude as whole columns, float32 keeps ~1 m precision at half the size
+        farms_table = farms_table.add_column(0, 'Latitude', pa.array(np.repeat(farms[:, 0], table.num_rows)))
+        farms_table = farms_table.add_column(1, 'Longitude', pa.array(np.repeat(farms[:, 1], table.num_rows)))
+
+        if writer is None:
+            #The file schema is fixed by the first response, CAMS values are stored as float32 like the coordinates
+            schema = pa.schema([field.with_type(pa.float32()) if pa.types.is_floating(field.type) else field
+                                for field in farms_table.schema], metadata=farms_table.schema.metadata)
+            writer = pq.ParquetWriter(output_file, schema, compression='snappy')
+
+        #Casting to the file schema also covers columns inferred as null when a response is all NaN
+        writer.write_table(farms_table.cast(writer.schema))
+        rows_written += farms_table.num_rows
+        farms_written += len(farms)
 
-        except Exception as e:
-            print(f"Error processing record {idx} with latitude {latitude} and longitude {longitude}: {e}")
+    try:
+        asyncio.run(fetch_all_locations(urls, write_response, timeout=timeout, max_workers=max_workers,
+                                        integrated=integrated, label=label, map_variables=map_variables))
+    finally:
+        if writer is not None:
+            writer.close()
 
-    return cams_df
+    return rows_written, farms_written
 
 
 # In[87]:
 
 
-def validate_output(output_data, start_date, end_date, time_step, output_folder):
+def validate_output(output_file, num_farms, start_date, end_date, time_step, output_folder, chunk_name):
     """
-    Validates output data against expected row counts and saves a file in the results folder validation is successful.
+    Validates the output file against expected row counts and moves it to the results folder if validation is successful.
 
       Parameters:
-        output_data (DataFrame): The processed output data to be validated.
+        output_file (str or Path): The Parquet file written by fetch_cams_data to be validated.
+        num_farms (int): Number of unique farm (Latitude, Longitude) pairs written to output_file.
         start_date (str): The start date of the data range in the format "YYYY-MM-DD".
         end_date (str): The end date of the data range in the format "YYYY-MM-DD".
-        time_step (str): The time step of the data aggregation (e.g., '1min', '15min', '1h', '1M').
+        time_step (str): The time step of the data aggregation (e.g., '1min', '15min', '1h', '1d', '1M').
                          - '1min': 1-minute intervals
                          - '15min': 15-minute intervals
                          - '1h': 1-hour intervals
+                         - '1d': Daily intervals
                          - '1M': Monthly intervals
-        output_folder (str): The path to the folder where the validated output should be saved.
+        output_folder (str or Path): The path to the folder where the validated output should be saved.
+        chunk_name (str): Name of the input chunk, used in the results file name.
 
     Returns:
         bool: Returns `True` if validation is successful and the file is saved.
     """
-    total_hours = 24
-    #'1min', '15min', '1h', '1d', '1M'
-    time_step_ref = {
-        "1min": 1, 
-        "15min":15, 
-        "1h": 60, 
-        "1M": None
-    }
-
-    unique_locations = output_data['Latitude'].nunique()
+    #Row count comes from the Parquet footer, no data is read
+    output_file = pathlib.Path(output_file)
+    num_rows = pq.ParquetFile(output_file).metadata.num_rows
 
-    #Convert date string to datetime
-    start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-    end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+    #Convert date string to timestamp
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
 
     if time_step == "1M":
-        exp_rows = (end_date.year - start_date.year)*12 + (end_date.month - start_date.month) + 1
-        exp_rows = exp_rows * unique_locations
+        rows_per_location = (end_date.year - start_date.year)*12 + (end_date.month - start_date.month) + 1
     else:
-        time_delta = ((end_date + datetime.timedelta(days=1)) - start_date).total_seconds() / 60
-        exp_rows = int(time_delta // time_step_ref[time_step])
-        exp_rows = exp_rows * unique_locations
+        #'1min', '15min', '1h' and '1d' are all fixed length time steps
+        rows_per_location = int((end_date + pd.Timedelta('1D') - start_date) / pd.Timedelta(time_step))
+    exp_rows = rows_per_location * num_farms
 
-    if len(output_data) == exp_rows:
-        #If validation successful - Saving the processed data to csv file
+    if num_rows == exp_rows:
+        #If validation successful - Moving the processed data to the results file of the chunk
         cur_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        output_file = f"{output_folder}\\processed_cams_data_{cur_date}.csv"
-        output_data.to_csv(output_file, index=False)
-        print(f"expected row count: {exp_rows} found rows: {len(output_data)}") 
-        print(f"Output validation successful. Output saved to: {output_file}")
+        results_file = pathlib.Path(output_folder) / f"processed_cams_data_{chunk_name}_{cur_date}.parquet"
+
+        #Never overwrite earlier results, a chunk processed again on the same day gets a numbered file
+        run = 1
+        while results_file.exists():
+            results_file = pathlib.Path(output_folder) / f"processed_cams_data_{chunk_name}_{cur_date}_{run}.parquet"
+            run += 1
+        output_file.replace(results_file)
+        print(f"expected row count: {exp_rows} found rows: {num_rows}") 
+        print(f"Output validation successful. Output saved to: {results_file}")
         return True
     else:
-        raise ValueError(f"Expected row count: {exp_rows} but found rows {len(output_data)}")
+        raise ValueError(f"Expected row count: {exp_rows} but found rows {num_rows}")
         return False
         
 
 
+# In[ ]:
+
+
+def filter_processed_farms(solar_data, manifest_file, start_date, end_date, identifier, time_step):
+    """
+    Removes the farms already fetched for the same date range and CAMS parameters, and the farms
+    that failed MAX_FETCH_ATTEMPTS times.
+    Parameters:
+        solar_data (pd.DataFrame): Input DataFrame containing 'Latitude' and 'Longitude' columns.
+        manifest_file (str or Path): Parquet manifest written by update_manifest, it may not exist yet.
+        start_date (str): The start date of the data range in the format "YYYY-MM-DD".
+        end_date (str): The end date of the data range in the format "YYYY-MM-DD".
+        identifier (str): CAMS identifier ('mcclear' or 'cams_radiation').
+        time_step (str): The time step of the data aggregation.
+    Returns:
+        pd.DataFrame: The rows of solar_data that still need to be fetched.
+    """
+    if not pathlib.Path(manifest_file).exists():
+        return solar_data
+
+    manifest = pd.read_parquet(manifest_file)
+    manifest = manifest[(manifest['status'] == 'fetched') | (manifest['attempts'] >= MAX_FETCH_ATTEMPTS)]
+    farm_keys = solar_data[['Latitude', 'Longitude']].assign(start_date=start_date, end_date=end_date,
+                                                           identifier=identifier, time_step=time_step)
+
+    #Left anti join: keep the farms whose key is not in the manifest
+    processed = pd.MultiIndex.from_frame(farm_keys).isin(pd.MultiIndex.from_frame(manifest[MANIFEST_COLUMNS]))
+    return solar_data[~processed]
+
+
+# In[ ]:
+
+
+def update_manifest(manifest_file, requested_farms, fetched_farms, start_date, end_date, identifier, time_step):
+    """
+    Records the requested farms in the manifest with a 'fetched' or 'failed' status and the number of attempts,
+    so later runs skip fetched farms and stop retrying farms after MAX_FETCH_ATTEMPTS failures.
+    Parameters:
+        manifest_file (str or Path): Parquet manifest to create or update.
+        requested_farms (pd.DataFrame): DataFrame with the unique 'Latitude' and 'Longitude' of the requested farms.
+        fetched_farms (pd.DataFrame): DataFrame with the 'Latitude' and 'Longitude' of the farms written to the results.
+        start_date (str): The start date of the data range in the format "YYYY-MM-DD".
+        end_date (str): The end date of the data range in the format "YYYY-MM-DD".
+        identifier (str): CAMS identifier ('mcclear' or 'cams_radiation').
+        time_step (str): The time step of the data aggregation.
+    Returns:
+        None
+    """
+    entries = requested_farms[['Latitude', 'Longitude']].assign(start_date=start_date, end_date=end_date,
+                                                              identifier=identifier, time_step=time_step)
+    fetched = pd.MultiIndex.from_frame(entries[['Latitude', 'Longitude']]).isin(
+        pd.MultiIndex.from_frame(fetched_farms[['Latitude', 'Longitude']]))
+    entries['status'] = np.where(fetched, 'fetched', 'failed')
+    entries['attempts'] = 1
+
+    if pathlib.Path(manifest_file).exists():
+        #Farms seen by an earlier run add up their attempts and replace their previous entry
+        manifest = pd.read_parquet(manifest_file)
+        previous_keys = pd.MultiIndex.from_frame(manifest[MANIFEST_COLUMNS])
+        entry_keys = pd.MultiIndex.from_frame(entries[MANIFEST_COLUMNS])
+        previous_attempts = pd.Series(manifest['attempts'].to_numpy(), index=previous_keys).reindex(entry_keys)
+        entries['attempts'] += previous_attempts.fillna(0).to_numpy(dtype=int)
+        entries = pd.concat([manifest[~previous_keys.isin(entry_keys)], entries], ignore_index=True)
+    entries.to_parquet(manifest_file, index=False)
+
+
 # In[90]:
 
 
@@ -189,13 +464,26 @@ def main():
     5. If validation is successful, saves the results to a specified folder and moves the processed file
        from the unprocessed folder to the processed folder.
 
+    Farms already recorded in `results/_manifest.parquet` for the same date range and CAMS parameters are
+    skipped, farms whose request failed are retried by later runs up to MAX_FETCH_ATTEMPTS times. A data file
+    is moved to the processed folder once none of its farms are left to fetch. With `--dry_run` the farms left
+    to fetch are only reported.
+
     Parameters:
         None
 
     Returns:
         None
+
+    Raises:
+        RuntimeError: If CAMS data could not be fetched for some farms of the data file.
+        ValueError: If the fetched data does not have the expected row count.
     """
     try:
+        parser = argparse.ArgumentParser(description="Fetch CAMS data for the oldest unprocessed data file")
+        parser.add_argument("--dry_run", action="store_true", help="Only report the farms that would be fetched.")
+        args = parser.parse_args()
+
        #Load config file
         print(os.getcwd())
         config = load_config('config.json')
@@ -210,6 +498,8 @@ def main():
         server_name = config["server_name"]
         timeout = config["timeout"]
         email = config["email"]
+        max_workers = config.get("max_workers", 8)
+        grid_resolution = config.get("grid_resolution")
     
         #Parameters for folder structure
         unprocessed_folder = config["unprocessed_folder"]
@@ -221,37 +511,76 @@ def main():
     
         #Get the file need to processed from unprocessed folder
         datafile = get_file_to_process(unprocessed_folder)
-        file_name = datafile.split("\\")
-        processed_file = f"{processed_folder}\\{file_name[-1]}"
-        print(processed_file)
-    
-        if (datafile):
-            print(f"Processing {datafile}")
-        else:
+        if not datafile:
             print("There is no datafile to process.")
+            return
+
+        datafile = pathlib.Path(datafile)
+        processed_file = pathlib.Path(processed_folder) / datafile.name
+        print(f"Processing {datafile}")
     
-        #Load the input file 
-        solar_data = pd.read_csv(datafile)
+        #Load the input file, only the coordinates are needed to fetch CAMS data
+        solar_data = pd.read_parquet(datafile, columns=['Latitude', 'Longitude'])
+        solar_data = solar_data.astype({'Latitude': 'float32', 'Longitude': 'float32'})
         print(solar_data.head())
         print(processed_folder)
+
+        #Skip the farms already fetched by a previous run
+        manifest_file = pathlib.Path(results_folder) / "_manifest.parquet"
+        solar_data = filter_processed_farms(solar_data, manifest_file, start_date, end_date, sky_type, time_step)
+        print(f"{len(solar_data)} farms to fetch from {datafile}")
+
+        if args.dry_run:
+            return
+        if solar_data.empty:
+            print(f"All farms in the datafile were already fetched or failed {MAX_FETCH_ATTEMPTS} times.")
+            processed_file.parent.mkdir(parents=True, exist_ok=True)
+            datafile.replace(processed_file)
+            return
     
-        #Fetch CAMS data
-        cams_details = fetch_cams_data(solar_data, start_date=start_date, end_date=end_date, email=email, \
-                                     identifier=sky_type, time_step=time_step, time_ref=time_reference, server=server_name, \
-                                     timeout=timeout)
-    
-        #Validate output 
-        status = validate_output(cams_details, start_date, end_date, time_step, results_folder)
-        
-        if status:
-            if not os.path.exists(processed_folder):
-                os.makedirs(processed_folder)
+        #Fetch CAMS data, streamed into a partial file until it is validated. The leading underscore keeps it
+        #out of pyarrow dataset discovery of the results folder, it is removed unless validation moved it
+        output_file = pathlib.Path(results_folder) / f"_{datafile.stem}.partial.parquet"
+        try:
+            rows_written, farms_written = fetch_cams_data(solar_data, output_file, start_date=start_date, end_date=end_date, email=email, \
+                                         identifier=sky_type, time_step=time_step, time_ref=time_reference, server=server_name, \
+                                         timeout=timeout, max_workers=max_workers, grid_resolution=grid_resolution)
+            print(f"{rows_written} rows for {farms_written} farms written to {output_file}")
+
+            #Farms actually present in the output, the other requested farms failed
+            fetched_farms = solar_data.iloc[:0]
+            if rows_written:
+                fetched_farms = pq.read_table(output_file, columns=['Latitude', 'Longitude'])
+                fetched_farms = fetched_farms.group_by(['Latitude', 'Longitude']).aggregate([]).to_pandas()
+
+                #Validate output 
+                validate_output(output_file, farms_written, start_date, end_date, time_step, results_folder,
+                                datafile.stem)
+        finally:
+            output_file.unlink(missing_ok=True)
+
+        requested_farms = solar_data[['Latitude', 'Longitude']].drop_duplicates()
+        update_manifest(manifest_file, requested_farms, fetched_farms, start_date, end_date, sky_type, time_step)
+
+        #Keep the file in the unprocessed folder while some of its failed farms can still be retried
+        if filter_processed_farms(solar_data, manifest_file, start_date, end_date, sky_type, time_step).empty:
+            processed_file.parent.mkdir(parents=True, exist_ok=True)
             print(processed_file)
-            os.rename(datafile, processed_file)
+            datafile.replace(processed_file)
+        else:
+            print(f"{datafile} is kept for the next run to retry the failed farms.")
+
+        #Fail the run, so a scheduler sees the farms that could not be fetched
+        failed_farms = len(requested_farms) - len(fetched_farms)
+        if failed_farms:
+            raise RuntimeError(f"CAMS data could not be fetched for {failed_farms} of {len(requested_farms)} farms, "
+                               f"see the failed entries in {manifest_file}")
 
             
     except Exception as e:
+        #Log and re-raise, so a scheduler sees the failed run and can retry it
         print(f"An error occured: {e}")
+        raise
         
 
 
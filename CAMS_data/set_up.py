@@ -7,7 +7,10 @@
 #Import required libraries
 import datetime
 import os
-import json
+import orjson
+import pathlib
+import math
+import numpy as np
 import pandas as pd
 import argparse
 
@@ -26,24 +29,23 @@ def set_up_folders():
 
     Returns:
         tuple: A tuple containing the paths to the created folders:
-            - unprocessed_folder (str): Path to the 'unprocessed' folder.
-            - processed_folder (str): Path to the 'processed' folder.
-            - results_folder (str): Path to the 'results' folder.
+            - unprocessed_folder (Path): Path to the 'unprocessed' folder.
+            - processed_folder (Path): Path to the 'processed' folder.
+            - results_folder (Path): Path to the 'results' folder.
     """
 
     try:
-        cams_folder = os.getcwd()
+        cams_folder = pathlib.Path.cwd()
         print(cams_folder)
         print(f"Home dir is: {cams_folder}")
         
          #Create folders in 'CAMS_data'
-        unprocessed_folder = os.path.join(cams_folder, 'unprocessed')
-        processed_folder = os.path.join(cams_folder, 'processed')
-        results_folder = os.path.join(cams_folder, 'results')
+        unprocessed_folder = cams_folder / 'unprocessed'
+        processed_folder = cams_folder / 'processed'
+        results_folder = cams_folder / 'results'
 
-        os.makedirs(unprocessed_folder, exist_ok=True)
-        os.makedirs(processed_folder, exist_ok=True)
-        os.makedirs(results_folder, exist_ok=True)
+        for folder in (unprocessed_folder, processed_folder, results_folder):
+            folder.mkdir(exist_ok=True)
         print("Folder structure created successfully.")
         return unprocessed_folder, processed_folder, results_folder
     except OSError as e:
@@ -67,8 +69,8 @@ def create_config_file(config_params):
         None
     """
     try:
-        with open('config.json', 'w') as json_file:
-            json.dump(config_params, json_file, indent=4)
+        with open('config.json', 'wb') as json_file:
+            json_file.write(orjson.dumps(config_params, option=orjson.OPT_INDENT_2))
         print(f"Config file created in the {os.getcwd()}.")
     except Exception as e:
         print(f"An error occured {e}")
@@ -79,31 +81,35 @@ def create_config_file(config_params):
 
 def chunk_data(file_path, output_folder):
     """
-    Reads a CSV file, splits it into smaller chunks, and saves each chunk as a separate CSV file.
+    Reads a CSV file, splits it into smaller chunks, and saves each chunk as a separate Parquet file.
 
     Parameters:
         file_path (str): The path to the input CSV file.
-        output_folder (str): The folder where the chunked CSV files will be saved.
+        output_folder (str or Path): The folder where the chunked Parquet files will be saved.
     Returns:
         int: The total number of chunked files created.
 
     """
-    # Read the CSV file into a DataFrame
+    # Read the CSV file into a DataFrame with the multi-threaded pyarrow parser, all columns are kept in the chunks
     chunk_size = 100
-    solar_farms_data = pd.read_csv(file_path)
+    solar_farms_data = pd.read_csv(file_path, engine='pyarrow')
+
+    # Split the row positions into evenly sized chunks of at most chunk_size rows
+    num_chunks = math.ceil(len(solar_farms_data) / chunk_size)
+    chunk_positions = np.array_split(np.arange(len(solar_farms_data)), num_chunks) if num_chunks else []
+    output_folder = pathlib.Path(output_folder)
+
+    for i, positions in enumerate(chunk_positions):
+        chunk = solar_farms_data.iloc[positions]
 
-    # Split the DataFrame into chunks
-    for i, start in enumerate(range(0, len(solar_farms_data), chunk_size)):
-        chunk = solar_farms_data.iloc[start: start + chunk_size]
-        
         # Define the file name for the current chunk
-        chunk_file = os.path.join(output_folder, f'unprocessed_data_{i+1}.csv')
-        
-        # Save the chunk to a CSV file
-        chunk.to_csv(chunk_file, index=False)
+        chunk_file = output_folder / f'unprocessed_data_{i+1}.parquet'
+
+        # Save the chunk to a Parquet file
+        chunk.to_parquet(chunk_file, index=False)
 
-    print(f"Successfully created {i + 1} chunked files in '{output_folder}'.")
-    return i + 1
+    print(f"Successfully created {num_chunks} chunked files in '{output_folder}'.")
+    return num_chunks
 
 
 # In[73]:
@@ -131,6 +137,7 @@ def main():
         parser.add_argument("--time_step", type=str, required=True, choices=['1min', '15min', '1h', '1d', '1M'], help="Time step.")
         parser.add_argument("--time_reference", type=str, required=True, choices=['UT', 'TST'], help="‘UT’ (universal time) or ‘TST’ (True Solar Time)")
         parser.add_argument("--email", type=str, required=True, help="Email registered with the soda pro service.")
+        parser.add_argument("--grid_resolution", type=float, default=None, help="Optional grid size in degrees (e.g. 0.05), farms in the same grid cell share one CAMS request.")
     
         args = parser.parse_args()
         #Conver the command line argument to dictionary
@@ -144,11 +151,12 @@ def main():
         #parameters to add to the config file
         #params["start_date"] = params["start_date"].strftime("%Y-%m-%d")
         #params["end_date"] = params["end_date"].strftime("%Y-%m-%d")
-        params["unprocessed_folder"] = unprocessed_folder
-        params["processed_folder"] = processed_folder
-        params["results_folder"] = results_folder
+        params["unprocessed_folder"] = str(unprocessed_folder)
+        params["processed_folder"] = str(processed_folder)
+        params["results_folder"] = str(results_folder)
         params["server_name"] = 'api.soda-solardata.com'
         params["timeout"] = 30
+        params["max_workers"] = 8
 
         #Creating config file
         create_config_file(params)